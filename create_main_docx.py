@@ -5,14 +5,26 @@ from docx.shared import Inches
 # Read the final_tally.csv
 pairs = set()
 with open('output/final_tally.csv', 'r', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        if row['bookmarks_replaced'] and row['json']:
-            bookmarks = row['bookmarks_replaced'].split(';')
-            jsons = row['json'].split(';')
-            if len(bookmarks) == len(jsons):
-                for b, j in zip(bookmarks, jsons):
-                    pairs.add((b.strip(), j.strip()))
+    reader = csv.reader(f)
+    header = next(reader, [])
+    # An empty tally has no header; it simply produces an empty table
+    if header:
+        missing = [c for c in ('bookmarks_replaced', 'json') if c not in header]
+        if missing:
+            raise ValueError(f"final_tally.csv is missing column(s): {', '.join(missing)}")
+        bookmarks_idx = header.index('bookmarks_replaced')
+        json_idx = header.index('json')
+        min_len = max(bookmarks_idx, json_idx) + 1
+        for row in reader:
+            # Skip blank rows and rows missing the trailing columns
+            if len(row) < min_len:
+                continue
+            if row[bookmarks_idx] and row[json_idx]:
+                bookmarks = row[bookmarks_idx].split(';')
+                jsons = row[json_idx].split(';')
+                if len(bookmarks) == len(jsons):
+                    for b, j in zip(bookmarks, jsons):
+                        pairs.add((b.strip(), j.strip()))
 
 # Create the document
 doc = Document()
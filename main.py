@@ -1,16 +1,26 @@
+from __future__ import annotations
+
 import re
 import unicodedata
 from pathlib import Path
 import csv
 import copy
+import io
+import os
+import shutil
+import sys
+import tempfile
 import traceback
-
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
 
 from docx import Document
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 # ----------------------------------------------------------------------
 # CONFIG (paths are relative to this script file)
 # ----------------------------------------------------------------------
@@ -21,6 +31,28 @@ TALLY_FILE = BASE_DIR / "output" / "bookmarks_tally.csv"
 UNIQUE_FILE = BASE_DIR / "output" / "unique_bookmarks.csv"
 DATA_DICT_FILE = BASE_DIR / "CWS-CARES Forms Data Dictionary-CountyDataElements V0.03.xlsx"
 
+# Data dictionary columns needed to build the valid-bookmark set
+VALID_BOOKMARK_COLUMNS = ["Bookmark Name"]
+
+# Legacy form-field bookmarks (Text1, Check2, ...) are never converted
+SKIP_PREFIXES = ("text", "check")
+
+
+# ----------------------------------------------------------------------
+# XML TAG / ATTRIBUTE NAMES
+# Resolved once here instead of calling qn() on every element visit.
+# ----------------------------------------------------------------------
+W_BKM_START = qn("w:bookmarkStart")
+W_BKM_END = qn("w:bookmarkEnd")
+W_NAME = qn("w:name")
+W_ID = qn("w:id")
+W_P = qn("w:p")
+W_PPR = qn("w:pPr")
+W_SPACING = qn("w:spacing")
+W_BEFORE = qn("w:before")
+W_AFTER = qn("w:after")
+XML_SPACE = qn("xml:space")
+
 
 # ----------------------------------------------------------------------
 # HELPERS
@@ -35,73 +67,200 @@ def sanitize_filename(stem: str) -> str:
     return cleaned or "document"
 
 
-def iter_bookmark_starts(doc):
-    for bkm in doc.element.body.iter(qn("w:bookmarkStart")):
-        name = bkm.get(qn("w:name"))
-        if name:
-            yield bkm, name
-
-
 def normalize_bookmark_name(name: str) -> str:
     s = name.strip()
+    if s.isascii():
+        return s  # NFKD + ASCII-ignore is the identity on pure ASCII
     s = unicodedata.normalize("NFKD", s)
     s = s.encode("ascii", "ignore").decode("ascii")
     return s
 
 
-def load_valid_bookmarks_from_excel(path: Path) -> set[str]:
+def _read_excel(path: Path, cols: list[str]) -> pd.DataFrame:
+    """
+    Returns only `cols` from the workbook, each as a pandas "string" column.
+    Tries, in order: polars' calamine reader, pandas' calamine engine (with
+    usecols, so unused columns are never built), openpyxl in read-only mode.
+    """
+    # The dataframe libraries are imported here rather than at module level:
+    # spawned pool workers re-import this module and never read the dictionary.
+    import pandas as pd
+
+    try:
+        import polars as pl  # pip install polars fastexcel
+    except ImportError:
+        pl = None
+
+    if pl is not None:
+        try:
+            # infer_schema_length=0 reads every cell as String, matching dtype="string"
+            frame = pl.read_excel(path, engine="calamine", infer_schema_length=0)
+            frame = frame.select([c for c in cols if c in frame.columns])
+            return frame.to_pandas().astype("string")
+        except ImportError:
+            pass  # fastexcel / pyarrow not installed
+
+    def usecols(c):
+        return c in cols
+
+    dtype = {c: "string" for c in cols}
+
+    try:
+        return pd.read_excel(path, engine="calamine", usecols=usecols, dtype=dtype)
+    except ImportError:
+        return pd.read_excel(
+            path,
+            engine="openpyxl",
+            engine_kwargs={"read_only": True, "data_only": True, "keep_links": False},
+            usecols=usecols,
+            dtype=dtype,
+        )
+
+
+def _dict_cache_key(path: Path, cols: list[str]) -> dict[bytes, bytes]:
+    return {
+        b"source_mtime_ns": str(path.stat().st_mtime_ns).encode("ascii"),
+        b"source_columns": "\x1f".join(cols).encode("utf-8"),
+    }
+
+
+def _key_matches(meta: dict | None, key: dict[bytes, bytes]) -> bool:
+    meta = meta or {}
+    return all(meta.get(k) == v for k, v in key.items())
+
+
+def _load_dict_cached(path: Path, cols: list[str]) -> pd.DataFrame:
+    """
+    Reads `cols` from the Excel data dictionary, reusing a parquet sidecar
+    (<name>.cache.parquet) when it was written from the same .xlsx mtime.
+    Columns missing from the sheet are simply absent from the result.
+    """
+    # Optional; imported lazily for the same reason as polars in _read_excel
+    try:
+        import pyarrow as pa  # pip install pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        pa = None
+        pq = None
+
+    key = _dict_cache_key(path, cols)
+    cache_path = path.with_suffix(".cache.parquet")
+
+    if pq is not None and cache_path.exists():
+        try:
+            table = pq.read_table(cache_path)
+            if _key_matches(table.schema.metadata, key):
+                return table.to_pandas()
+        except (OSError, pa.ArrowException):
+            pass  # unreadable cache; fall through and rebuild it
+
+    df = _read_excel(path, cols)
+
+    if pq is not None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta.update(key)
+        try:
+            # Write to a temp file beside the sidecar and swap it in, so an
+            # interrupted run never leaves a truncated parquet for readers.
+            fd, tmp_name = tempfile.mkstemp(dir=cache_path.parent, prefix=f"{cache_path.name}.", suffix=".tmp")
+            os.close(fd)
+            try:
+                pq.write_table(table.replace_schema_metadata(meta), tmp_name)
+                os.replace(tmp_name, cache_path)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except OSError:
+            pass  # read-only location; caching is best effort
+
+    return df
+
+
+def load_valid_bookmarks_from_excel(path: Path) -> frozenset[str]:
     if not path.exists():
         raise FileNotFoundError(f"Excel data dictionary not found: {path}")
-    df = pd.read_excel(path)
+    df = _load_dict_cached(path, VALID_BOOKMARK_COLUMNS)
     if "Bookmark Name" not in df.columns:
         raise ValueError("DataDictionary.xlsx must have a 'Bookmark Name' column")
-    return set(df["Bookmark Name"].dropna().astype(str).str.strip())
+    names = df["Bookmark Name"].dropna().str.strip()
+    return frozenset(names[names.str.len().gt(0)])
 
 
 def get_paragraph_element(elm):
-    while elm is not None and elm.tag != qn("w:p"):
+    while elm is not None and elm.tag != W_P:
         elm = elm.getparent()
     return elm
 
 
-def find_bookmark_end(doc, start):
-    start_id = start.get(qn("w:id"))
+def scan_bookmarks(doc) -> tuple[list, dict]:
+    """
+    One body traversal that returns:
+      - [(bookmarkStart, name), ...] in document order
+      - {w:id: first bookmarkEnd with that id}
+
+    The starts are snapshotted rather than iterated lazily: replacing a
+    bookmark range can detach a nested bookmarkStart that lxml's iterator
+    has already queued, and continuing from a detached node ends the walk.
+    """
+    starts = []
+    ends_by_id = {}
+    for elm in doc.element.body.iter(W_BKM_START, W_BKM_END):
+        if elm.tag == W_BKM_START:
+            name = elm.get(W_NAME)
+            if name:
+                starts.append((elm, name))
+        else:
+            end_id = elm.get(W_ID)
+            if end_id is not None:
+                ends_by_id.setdefault(end_id, elm)
+    return starts, ends_by_id
+
+
+def find_bookmark_end(ends_by_id: dict, start):
+    start_id = start.get(W_ID)
     if start_id is None:
         return None
-    for end in doc.element.body.iter(qn("w:bookmarkEnd")):
-        if end.get(qn("w:id")) == start_id:
-            return end
-    return None
+    return ends_by_id.get(start_id)
 
 
-def _make_run_text(text: str):
+def _build_run_template():
     r = OxmlElement("w:r")
     t = OxmlElement("w:t")
-    t.set(qn("xml:space"), "preserve")
-    t.text = text
+    t.set(XML_SPACE, "preserve")
     r.append(t)
     return r
 
 
+# Deep-copied per replacement; cheaper than two OxmlElement() factory calls
+_RUN_TEMPLATE = _build_run_template()
+
+
+def _make_run_text(text: str):
+    r = copy.deepcopy(_RUN_TEMPLATE)
+    r[0].text = text
+    return r
+
+
 def set_paragraph_spacing(p_elm, before: str | None = None, after: str | None = None) -> None:
     """
     Forces paragraph spacing via w:pPr/w:spacing.
     This helps when splitting one paragraph into two causes a large visible gap.
     """
-    pPr = p_elm.find(qn("w:pPr"))
+    pPr = p_elm.find(W_PPR)
     if pPr is None:
         pPr = OxmlElement("w:pPr")
         p_elm.insert(0, pPr)
 
-    spacing = pPr.find(qn("w:spacing"))
+    spacing = pPr.find(W_SPACING)
     if spacing is None:
         spacing = OxmlElement("w:spacing")
         pPr.append(spacing)
 
     if before is not None:
-        spacing.set(qn("w:before"), str(before))
+        spacing.set(W_BEFORE, str(before))
     if after is not None:
-        spacing.set(qn("w:after"), str(after))
+        spacing.set(W_AFTER, str(after))
 
 
 # ----------------------------------------------------------------------
@@ -118,13 +277,12 @@ def split_paragraph_before_bookmark(bkm_start) -> bool:
     if p_parent is None:
         return False
 
-    children = list(p)
     try:
-        i_start = children.index(bkm_start)
+        i_start = p.index(bkm_start)
     except ValueError:
         return False
 
-    has_ppr = (len(children) > 0 and children[0].tag == qn("w:pPr"))
+    has_ppr = (len(p) > 0 and p[0].tag == W_PPR)
     first_movable_idx = 1 if has_ppr else 0
 
     # Nothing before the bookmark other than pPr
@@ -134,22 +292,14 @@ def split_paragraph_before_bookmark(bkm_start) -> bool:
     # Create new paragraph and copy pPr if present
     new_p = OxmlElement("w:p")
     if has_ppr:
-        new_p.append(copy.deepcopy(children[0]))
+        new_p.append(copy.deepcopy(p[0]))
 
     # Move nodes before bookmarkStart into new paragraph
-    to_move = children[first_movable_idx:i_start]
-    for node in to_move:
-        p.remove(node)
-        new_p.append(node)
+    # (lxml's extend() reparents them in a single call)
+    new_p.extend(p[first_movable_idx:i_start])
 
     # Insert new paragraph immediately before original paragraph
-    parent_children = list(p_parent)
-    try:
-        p_index = parent_children.index(p)
-    except ValueError:
-        return False
-
-    p_parent.insert(p_index, new_p)
+    p_parent.insert(p_parent.index(p), new_p)
 
     # ------------------------------------------------------------------
     # IMPORTANT SPACING FIX:
@@ -168,8 +318,8 @@ def split_paragraph_before_bookmark(bkm_start) -> bool:
     return True
 
 
-def replace_bookmark_range_with_text(doc, bkm_start, text: str) -> bool:
-    bkm_end = find_bookmark_end(doc, bkm_start)
+def replace_bookmark_range_with_text(ends_by_id: dict, bkm_start, text: str) -> bool:
+    bkm_end = find_bookmark_end(ends_by_id, bkm_start)
     if bkm_end is None:
         return False
 
@@ -179,65 +329,158 @@ def replace_bookmark_range_with_text(doc, bkm_start, text: str) -> bool:
         return False  # skip complex spanning cases
 
     parent = start_parent
-    children = list(parent)
     try:
-        i_start = children.index(bkm_start)
-        i_end = children.index(bkm_end)
+        i_start = parent.index(bkm_start)
+        i_end = parent.index(bkm_end)
     except ValueError:
         return False
 
-    for child in children[i_start + 1 : i_end]:
-        parent.remove(child)
+    removed = parent[i_start + 1 : i_end]
+    del parent[i_start + 1 : i_end]
+
+    # Ends inside the removed content are no longer in the body; drop them so
+    # bookmarks nested in that content (e.g. inside a w:hyperlink) are not
+    # "replaced" in the detached subtree and counted.
+    for child in removed:
+        for end in child.iter(W_BKM_END):
+            end_id = end.get(W_ID)
+            if ends_by_id.get(end_id) is end:
+                del ends_by_id[end_id]
 
     parent.insert(i_start + 1, _make_run_text(text))
     return True
 
 
-def process_document(input_path: Path, unique_set: set, valid_bookmarks: set[str]) -> tuple[str, int]:
+def copy_doc_without_changes(doc_path: Path, out_path: Path) -> None:
+    """
+    Stages an untouched document in the output folder without re-serializing
+    every XML part through python-docx. This is deliberately a real copy, not
+    a hardlink: a linked output shares its bytes with the input template, so
+    any later save to the output would overwrite the original.
+    """
+    shutil.copy2(doc_path, out_path)
+
+
+def output_name_for(input_path: Path) -> str:
+    return f"{sanitize_filename(input_path.stem)}.docx"
+
+
+def group_by_output_name(paths: list[Path]) -> list[list[Path]]:
+    """
+    Inputs in different subfolders can sanitize to the same output name.
+    Such inputs stay together, in rglob order, so a single worker processes
+    them one after another: the last one wins the output file exactly as in
+    a serial run, and every input still gets its tally row.
+    """
+    groups: dict[str, list[Path]] = {}
+    for path in paths:
+        groups.setdefault(output_name_for(path), []).append(path)
+    return list(groups.values())
+
+
+def process_document(input_path: Path, unique_set: set, valid_bookmarks: frozenset[str]) -> tuple[str, int]:
     doc = Document(input_path)
     bookmark_count = 0
+    changed = False
 
-    bookmarks_to_process = list(iter_bookmark_starts(doc))
+    bookmarks_to_process, ends_by_id = scan_bookmarks(doc)
 
     for bkm, name in bookmarks_to_process:
-        lower_name = name.lower()
-
-        if lower_name.startswith("text") or lower_name.startswith("check"):
-            continue
-
-        if name not in valid_bookmarks:
+        if name.lower().startswith(SKIP_PREFIXES) or name not in valid_bookmarks:
             continue
 
         cleaned = normalize_bookmark_name(name)
         if cleaned:
             unique_set.add(cleaned)
 
-        split_paragraph_before_bookmark(bkm)
+        if split_paragraph_before_bookmark(bkm):
+            changed = True
 
-        if replace_bookmark_range_with_text(doc, bkm, name):
+        if replace_bookmark_range_with_text(ends_by_id, bkm, name):
             bookmark_count += 1
+            changed = True
 
-    stem = sanitize_filename(input_path.stem)
-    output_filename = f"{stem}.docx"
+    output_filename = output_name_for(input_path)
     output_path = OUTPUT_DIR / output_filename
-    doc.save(output_path)
+    if changed:
+        doc.save(output_path)
+    else:
+        copy_doc_without_changes(input_path, output_path)
 
     return output_filename, bookmark_count
 
 
+# ----------------------------------------------------------------------
+# PARALLEL BATCH
+# Each document is an independent, CPU-bound parse/modify/save, so the
+# batch is fanned out over a process pool. The bookmark set main() loaded
+# and validated is handed to each worker once via the pool initializer,
+# so workers never touch the .xlsx or its sidecar themselves.
+# ----------------------------------------------------------------------
+_worker_valid_bookmarks: frozenset[str] = frozenset()
+
+
+def _init_worker(valid_bookmarks: frozenset[str]) -> None:
+    global _worker_valid_bookmarks
+    _worker_valid_bookmarks = valid_bookmarks
+
+
+def process_document_path(input_path: Path) -> tuple[Path, str | None, int, set, tuple[str, str] | None]:
+    """
+    Worker entry point. Returns (input_path, output_name, count, unique_names, error).
+    error is (message, formatted traceback) so one bad file does not abort the batch.
+    """
+    unique_set = set()
+    try:
+        output_name, count = process_document(input_path, unique_set, _worker_valid_bookmarks)
+    except Exception as e:
+        return input_path, None, 0, unique_set, (str(e), traceback.format_exc())
+    return input_path, output_name, count, unique_set, None
+
+
+def process_document_group(input_paths: list[Path]) -> list[tuple]:
+    """Worker task: processes inputs that share an output name, in order."""
+    return [process_document_path(p) for p in input_paths]
+
+
+def run_document_groups(groups: list[list[Path]], valid_bookmarks: frozenset[str]):
+    """
+    Yields each group's results in group order. A single task runs inline
+    (no pool start-up cost); otherwise the pool is sized to the batch and
+    the chunksize still leaves about four chunks per worker to balance load.
+    """
+    if len(groups) == 1:
+        _init_worker(valid_bookmarks)
+        yield process_document_group(groups[0])
+        return
+
+    max_workers = min(os.cpu_count() or 1, len(groups))
+    if sys.platform == "win32":
+        max_workers = min(max_workers, 61)  # ProcessPoolExecutor limit on Windows
+    chunksize = max(1, len(groups) // (max_workers * 4))
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(valid_bookmarks,)
+    ) as ex:
+        yield from ex.map(process_document_group, groups, chunksize=chunksize)
+
+
+# CSVs are built in memory and written with a single call; newline=""
+# keeps csv's \r\n row endings from being translated again on Windows.
 def write_tally(tally_rows):
-    with open(TALLY_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["document_name", "number_of_bookmarks"])
-        writer.writerows(tally_rows)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["document_name", "number_of_bookmarks"])
+    writer.writerows(tally_rows)
+    TALLY_FILE.write_text(buf.getvalue(), encoding="utf-8", newline="")
 
 
 def write_unique_bookmarks(unique_set: set):
-    with open(UNIQUE_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["bookmark_name", "json"])
-        for name in sorted(unique_set):
-            writer.writerow([name, ""])
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["bookmark_name", "json"])
+    writer.writerows([name, ""] for name in sorted(unique_set))
+    UNIQUE_FILE.write_text(buf.getvalue(), encoding="utf-8", newline="")
 
 
 def find_input_docx_files(input_dir: Path) -> list[Path]:
@@ -268,20 +511,25 @@ def main():
 
     print(f"Found {len(paths)} .docx file(s).")
 
-    tally_rows = []
+    groups = group_by_output_name(paths)
+    input_order = {path: i for i, path in enumerate(paths)}
+
+    tally_rows = []  # (input order, row); sorted back into rglob order below
     unique_bookmarks = set()
 
-    for path in paths:
-        try:
-            output_name, count = process_document(path, unique_bookmarks, valid_bookmarks)
-            tally_rows.append([output_name, count])
+    for group_results in run_document_groups(groups, valid_bookmarks):
+        for path, output_name, count, names, error in group_results:
+            if error is not None:
+                message, tb = error
+                print(f"ERROR processing {path}: {message}")
+                print(tb, end="", file=sys.stderr)
+                continue
+            tally_rows.append((input_order[path], [output_name, count]))
+            unique_bookmarks.update(names)
             print(f"Processed: {path.name} -> {output_name} ({count} bookmark(s))")
-        except Exception as e:
-            print(f"ERROR processing {path}: {e}")
-            traceback.print_exc()
 
     if tally_rows:
-        write_tally(tally_rows)
+        write_tally([row for _, row in sorted(tally_rows)])
         write_unique_bookmarks(unique_bookmarks)
         print(f"Wrote outputs to: {OUTPUT_DIR}")
         print(f"Tally CSV:  {TALLY_FILE}")